@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark for keyboard panel plugin
+
+Times `keyboard_panel.py --help`, which loads GTK and all plugin modules
+and exits before creating any windows, in three setups:
+
+  source, no cache - loose modules with unwritable __pycache__ (as in
+                     /usr/local/bin), everything is compiled on each start
+  source, cached   - loose modules with bytecode cache
+  bundle           - byte-compiled zipapp built by build_bundle.py
+
+For each setup the first (cold) run and the median of the warm runs are
+reported. Page cache is not dropped, so "cold" means cold for Python only.
+"""
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+BUNDLE = os.path.join(ROOT_DIR, 'build', 'keyboard_panel.pyz')
+RUNS = 10
+
+def run_once(args, env):
+    start = time.perf_counter()
+    subprocess.run(args, env=env, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+def measure(args, env, runs):
+    """Returns (first run, median of following runs) in ms"""
+    first = run_once(args, env)
+    warm = [run_once(args, env) for _ in range(runs)]
+    return first, statistics.median(warm)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    if not os.path.exists(BUNDLE):
+        print("Error: {} not found, run 'make bundle' first".format(BUNDLE))
+        sys.exit(1)
+
+    script = os.path.join(SRC_DIR, 'keyboard_panel.py')
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    nocache_env = dict(env, PYTHONDONTWRITEBYTECODE='1')
+
+    shutil.rmtree(os.path.join(SRC_DIR, '__pycache__'), ignore_errors=True)
+    cases = [
+        ('source, no cache', [sys.executable, script, '--help'], nocache_env),
+        ('source, cached', [sys.executable, script, '--help'], env),
+        ('bundle', [sys.executable, BUNDLE, '--help'], env)
+    ]
+
+    print("{:<18} {:>10} {:>10}".format('', 'cold, ms', 'warm, ms'))
+    for name, args, case_env in cases:
+        first, warm = measure(args, case_env, runs)
+        print("{:<18} {:>10.1f} {:>10.1f}".format(name, first, warm))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Builds byte-compiled single-file bundle of keyboard panel plugin
+
+The bundle is an executable zip archive (zipapp) holding .pyc files
+compiled by the interpreter that will run it, so nothing is compiled on
+startup and no __pycache__ has to be written next to the installed code.
+The launcher pins that interpreter by absolute path. Sources are shipped
+too: if the bundle still ends up under another Python version, zipimport
+skips the .pyc with foreign magic number and compiles the source instead.
+
+The plugin modules live inside the archive instead of a shared bin
+directory, so their flat names can't shadow other scripts' imports. Inside
+the panel process they are still top-level modules (the archive is
+sys.path[0]).
+"""
+
+import os
+import sys
+import glob
+import shlex
+import zipfile
+import tempfile
+import py_compile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+# Entry point: same handoff as running keyboard_panel.py as a script
+MAIN_SOURCE = """import sys
+import instance
+
+if instance.forward_command(sys.argv[1:]):
+    sys.exit(0)
+
+import keyboard_panel
+keyboard_panel.main()
+"""
+
+def compile_module(source_path, name, tmpdir):
+    """Compiles source file to .pyc and returns its contents"""
+    cfile = os.path.join(tmpdir, name + '.pyc')
+    kwargs = {}
+    if hasattr(py_compile, 'PycInvalidationMode'):
+        # Zip entry times don't match source mtime, don't validate against them
+        kwargs['invalidation_mode'] = py_compile.PycInvalidationMode.UNCHECKED_HASH
+    py_compile.compile(source_path, cfile=cfile, dfile=name + '.py', doraise=True, **kwargs)
+    with open(cfile, 'rb') as f:
+        return f.read()
+
+def build_bundle(target):
+    """Writes bundle to target path"""
+    target_dir = os.path.dirname(os.path.abspath(target))
+    os.makedirs(target_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        main_path = os.path.join(tmpdir, '__main__.py')
+        with open(main_path, 'w') as f:
+            f.write(MAIN_SOURCE)
+
+        modules = [(main_path, '__main__')]
+        for path in sorted(glob.glob(os.path.join(SRC_DIR, '*.py'))):
+            modules.append((path, os.path.splitext(os.path.basename(path))[0]))
+
+        tmp_target = target + '.tmp'
+        with open(tmp_target, 'wb') as f:
+            f.write(b'#!/usr/bin/env python3\n')
+            # Stored, not deflated: the archive is small and loads without zlib
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as bundle:
+                for path, name in modules:
+                    bundle.writestr(name + '.pyc', compile_module(path, name, tmpdir))
+                    bundle.write(path, name + '.py')
+        os.chmod(tmp_target, 0o755)
+        os.replace(tmp_target, target)
+
+    print("Built {} ({} modules, Python {}.{})".format(
+        target, len(modules), sys.version_info[0], sys.version_info[1]))
+
+def build_launcher(target, bundle_path):
+    """Writes shell launcher running installed bundle with this interpreter"""
+    with open(target, 'w') as f:
+        f.write('#!/bin/sh\nexec {} {} "$@"\n'.format(
+            shlex.quote(sys.executable), shlex.quote(bundle_path)))
+    os.chmod(target, 0o755)
+    print("Built {} ({})".format(target, sys.executable))
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        build_bundle(sys.argv[1])
+    elif len(sys.argv) == 4 and sys.argv[1] == '--launcher':
+        build_launcher(sys.argv[2], sys.argv[3])
+    else:
+        print("Usage: build_bundle.py <target.pyz>")
+        print("       build_bundle.py --launcher <target> <installed.pyz>")
+        sys.exit(1)
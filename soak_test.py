@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Soak test for keyboard panel plugin
+
+Runs the panel headless (Xvfb) against a scripted setxkbmap stand-in and
+drives thousands of layout changes, clicks, menu popups and settings
+toggles. RSS, Python allocations (tracemalloc), live GObject wrappers and
+GTK toplevel windows are sampled over time. Menus kept alive by GTK without
+any Python reference show up only in the toplevel count, as every Gtk.Menu
+owns a toplevel window; the run fails if growth exceeds the budget and
+the call sites with the largest growth are reported.
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+FAKE_SETXKBMAP = """#!/bin/sh
+# setxkbmap stand-in: layout list is kept in $SOAK_STATE
+if [ "$1" = "-query" ]; then
+    echo "rules:      evdev"
+    echo "model:      pc105"
+    echo "layout:     $(cat "$SOAK_STATE")"
+else
+    echo "$1" > "$SOAK_STATE"
+fi
+"""
+
+LAYOUTS = ['us', 'ru', 'de']
+
+class FakeEvent:
+    """Minimal stand-in for Gdk.EventButton"""
+
+    def __init__(self, button):
+        self.button = button
+        self.time = 0
+
+class FakeToggle:
+    """Minimal stand-in for Gtk.CheckMenuItem"""
+
+    def __init__(self, active):
+        self.active = active
+
+    def get_active(self):
+        return self.active
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keyboard panel soak test")
+    parser.add_argument('--iterations', type=int, default=5000,
+                        help="number of simulated actions")
+    parser.add_argument('--sample-every', type=int, default=500,
+                        help="actions between memory samples")
+    parser.add_argument('--warmup', type=int, default=200,
+                        help="actions before the baseline sample")
+    parser.add_argument('--mode', choices=['wayland', 'appindicator'],
+                        default='wayland', help="panel mode to exercise")
+    parser.add_argument('--rss-budget', type=int, default=4096,
+                        help="allowed RSS growth, KiB")
+    parser.add_argument('--py-budget', type=int, default=512,
+                        help="allowed traced Python allocation growth, KiB")
+    parser.add_argument('--gobject-budget', type=int, default=20,
+                        help="allowed growth of live GObject wrappers")
+    parser.add_argument('--toplevel-budget', type=int, default=2,
+                        help="allowed growth of GTK toplevel windows")
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+def start_xvfb():
+    """Starts Xvfb on a free display and returns the process"""
+    read_fd, write_fd = os.pipe()
+    try:
+        xvfb = subprocess.Popen(
+            ['Xvfb', '-displayfd', str(write_fd), '-screen', '0', '1920x1080x24',
+             '-nolisten', 'tcp'],
+            pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    finally:
+        os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        xvfb.kill()
+        raise RuntimeError("Xvfb failed to start")
+    os.environ['DISPLAY'] = ':' + display
+    return xvfb
+
+def prepare_environment(workdir, mode):
+    """Isolates HOME and PATH so the run never touches real settings"""
+    bindir = os.path.join(workdir, 'bin')
+    os.makedirs(bindir)
+    setxkbmap = os.path.join(bindir, 'setxkbmap')
+    with open(setxkbmap, 'w') as f:
+        f.write(FAKE_SETXKBMAP)
+    os.chmod(setxkbmap, 0o755)
+
+    state = os.path.join(workdir, 'layout')
+    with open(state, 'w') as f:
+        f.write(','.join(LAYOUTS))
+
+    config_dir = os.path.join(workdir, '.config', 'keyboard-panel')
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, 'config.ini'), 'w') as f:
+        f.write("[behavior]\nswitch_interval = 0\n")
+
+    os.environ['SOAK_STATE'] = state
+    os.environ['HOME'] = workdir
+    os.environ['PATH'] = bindir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['GDK_BACKEND'] = 'x11'
+    if mode == 'wayland':
+        # Only selects the panel window code path, GDK still uses X11
+        os.environ['WAYLAND_DISPLAY'] = 'soak-test'
+    else:
+        os.environ.pop('WAYLAND_DISPLAY', None)
+        os.environ['XDG_SESSION_TYPE'] = 'x11'
+        os.environ['XDG_CURRENT_DESKTOP'] = 'soak-test'
+    return state
+
+def get_rss_kb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+def count_gobjects(GObject):
+    return sum(1 for o in gc.get_objects() if isinstance(o, GObject.Object))
+
+def pump(panel, Gtk, timeout=5.0):
+    """Runs main loop until pending switches and events are processed"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if Gtk.events_pending():
+            Gtk.main_iteration_do(False)
+        elif panel.switcher.is_pending():
+            time.sleep(0.001)
+        else:
+            break
+
+def run_action(panel, state, rng):
+    """Performs one random user or system action"""
+    action = rng.randrange(6)
+    if action == 0:
+        # Layout changed outside the panel (hotkey, other tool)
+        layouts = LAYOUTS[:]
+        rng.shuffle(layouts)
+        with open(state, 'w') as f:
+            f.write(','.join(layouts))
+        panel.update_current_layout()
+    elif action == 1:
+        panel.on_button_press(None, FakeEvent(1))
+    elif action == 2:
+        panel.on_layout_selected(None, rng.choice(LAYOUTS))
+    elif action == 3:
+        panel.on_button_press(None, FakeEvent(3))
+        if panel.popup_menu is not None:
+            panel.popup_menu.popdown()
+    elif action == 4:
+        icon_type = rng.choice(['none', 'keyboard', 'flag'])
+        panel.on_icon_type_changed(FakeToggle(True), icon_type)
+    else:
+        panel.on_show_text_changed(FakeToggle(rng.random() < 0.5))
+
+def take_sample(step, GObject, Gtk):
+    gc.collect()
+    return {
+        'step': step,
+        'rss': get_rss_kb(),
+        'py': tracemalloc.get_traced_memory()[0] // 1024,
+        'gobjects': count_gobjects(GObject),
+        'toplevels': len(Gtk.Window.list_toplevels())
+    }
+
+def report(samples, baseline, baseline_snapshot, args):
+    """Prints samples and leak sites, returns True if within budget"""
+    print("{:>8} {:>10} {:>10} {:>10} {:>10}".format(
+        'step', 'rss KiB', 'py KiB', 'gobjects', 'toplevels'))
+    for sample in samples:
+        print("{step:>8} {rss:>10} {py:>10} {gobjects:>10} {toplevels:>10}".format(**sample))
+
+    last = samples[-1]
+    growth = {
+        'rss': last['rss'] - baseline['rss'],
+        'py': last['py'] - baseline['py'],
+        'gobjects': last['gobjects'] - baseline['gobjects'],
+        'toplevels': last['toplevels'] - baseline['toplevels']
+    }
+    budgets = {
+        'rss': args.rss_budget,
+        'py': args.py_budget,
+        'gobjects': args.gobject_budget,
+        'toplevels': args.toplevel_budget
+    }
+
+    print("")
+    print("Top allocation growth since baseline:")
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.compare_to(baseline_snapshot, 'traceback')
+    for stat in [s for s in stats if s.size_diff > 0][:10]:
+        print("  {:+d} KiB, {:+d} blocks".format(stat.size_diff // 1024, stat.count_diff))
+        for line in stat.traceback.format(limit=3):
+            print("    " + line)
+
+    print("")
+    ok = True
+    for name in ('rss', 'py', 'gobjects', 'toplevels'):
+        status = 'OK' if growth[name] <= budgets[name] else 'FAIL'
+        if status == 'FAIL':
+            ok = False
+        print("[{}] {} growth {:+d} (budget {})".format(status, name, growth[name], budgets[name]))
+    return ok
+
+def main():
+    args = parse_args()
+    xvfb = None
+    with tempfile.TemporaryDirectory(prefix='keyboard-panel-soak-') as workdir:
+        state = prepare_environment(workdir, args.mode)
+        xvfb = start_xvfb()
+        try:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+            tracemalloc.start(10)
+            import keyboard_panel
+            from gi.repository import Gtk, GObject
+
+            panel = keyboard_panel.KeyboardPanel()
+            rng = random.Random(args.seed)
+            samples = []
+            baseline = None
+
+            for step in range(1, args.iterations + 1):
+                run_action(panel, state, rng)
+                pump(panel, Gtk)
+                if step == args.warmup:
+                    # Snapshot first so its own memory is part of the baseline
+                    gc.collect()
+                    baseline_snapshot = tracemalloc.take_snapshot()
+                    baseline = take_sample(step, GObject, Gtk)
+                    samples.append(baseline)
+                elif step > args.warmup and step % args.sample_every == 0:
+                    samples.append(take_sample(step, GObject, Gtk))
+
+            if baseline is None or len(samples) < 2:
+                print("Error: not enough iterations after warmup")
+                sys.exit(2)
+            panel.hooks.shutdown()
+            ok = report(samples, baseline, baseline_snapshot, args)
+        finally:
+            if xvfb is not None:
+                xvfb.terminate()
+                xvfb.wait()
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
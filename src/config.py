@@ -12,6 +12,7 @@ class Config:
     def __init__(self):
         self.config_dir = Path.home() / '.config' / 'keyboard-panel'
         self.config_file = self.config_dir / 'config.ini'
+        self.data_dir = Path.home() / '.local' / 'share' / 'keyboard-panel'
         
         # Default settings
         self.defaults = {
@@ -22,7 +23,27 @@ class Config:
             },
             'behavior': {
                 'update_interval': '1',   # seconds
+                'switch_interval': '150', # min ms between setxkbmap calls
                 'autostart': 'true'
+            },
+            'indicators': {
+                'caps_lock': 'false',
+                'num_lock': 'false',
+                'scroll_lock': 'false',
+                'level3': 'false'
+            },
+            'history': {
+                'enabled': 'true',
+                'file': '',               # default: ~/.local/share/keyboard-panel/history.bin
+                'capacity': '1024',       # events kept in memory between flushes
+                'flush_interval': '60'    # seconds
+            },
+            'hooks': {
+                'commands': '',           # executables, one per line
+                'entry_points': '',       # 'module:function', one per line
+                'timeout': '5',           # seconds per hook call
+                'workers': '2',
+                'queue_size': '16'        # oldest events dropped when full
             }
         }
         
@@ -106,8 +127,64 @@ class Config:
     def set_show_text(self, show):
         self.set_bool('display', 'show_text', show)
     
+    def get_indicator(self, name):
+        return self.get_bool('indicators', name, False)
+    
+    def set_indicator(self, name, show):
+        self.set_bool('indicators', name, show)
+    
     def get_update_interval(self):
         try:
             return max(1, int(self.get('behavior', 'update_interval', '1')))
         except ValueError:
-            return 1
\ No newline at end of file
+            return 1
+    
+    def get_switch_interval(self):
+        """Returns minimal delay between layout switches in seconds"""
+        try:
+            return max(0, int(self.get('behavior', 'switch_interval', '150'))) / 1000.0
+        except ValueError:
+            return 0.15
+    
+    def get_list(self, section, option):
+        """Get multiline configuration value as list of non-empty lines"""
+        value = self.get(section, option, '')
+        return [line.strip() for line in value.split('\n') if line.strip()]
+    
+    def get_int(self, section, option, fallback, minimum=0):
+        """Get integer configuration value"""
+        try:
+            return max(minimum, int(self.get(section, option, str(fallback))))
+        except ValueError:
+            return fallback
+    
+    def get_history_enabled(self):
+        return self.get_bool('history', 'enabled', True)
+    
+    def get_history_file(self):
+        path = self.get('history', 'file', '')
+        return os.path.expanduser(path) if path else str(self.data_dir / 'history.bin')
+    
+    def get_history_capacity(self):
+        return self.get_int('history', 'capacity', 1024, 1)
+    
+    def get_history_flush_interval(self):
+        return self.get_int('history', 'flush_interval', 60, 1)
+    
+    def get_hook_commands(self):
+        return self.get_list('hooks', 'commands')
+    
+    def get_hook_entry_points(self):
+        return self.get_list('hooks', 'entry_points')
+    
+    def get_hook_timeout(self):
+        try:
+            return max(0.1, float(self.get('hooks', 'timeout', '5')))
+        except ValueError:
+            return 5.0
+    
+    def get_hook_workers(self):
+        return self.get_int('hooks', 'workers', 2, 1)
+    
+    def get_hook_queue_size(self):
+        return self.get_int('hooks', 'queue_size', 16, 1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Layout usage history for keyboard panel plugin
+
+Switch events are packed into a preallocated ring buffer and periodically
+appended to a binary file of fixed-size records:
+
+    timestamp (float64) | layout (8 bytes, zero padded) | source (uint8)
+
+'start' and 'stop' records mark panel sessions so dwell time never spans
+the time the panel wasn't running.
+"""
+
+import sys
+import time
+import struct
+from pathlib import Path
+from config import Config
+
+LAYOUT_SIZE = 8
+RECORD = struct.Struct('<d{}sB'.format(LAYOUT_SIZE))
+SOURCES = ('click', 'hotkey', 'external', 'start', 'stop')
+SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+
+class UsageHistory:
+    """In-memory ring buffer of switch events flushed to an append-only file"""
+
+    def __init__(self, path, capacity=1024):
+        self.path = Path(path)
+        self.capacity = max(1, capacity)
+        self.buffer = bytearray(RECORD.size * self.capacity)
+        self.count = 0      # records ever added
+        self.flushed = 0    # records written to file
+        self.dropped = 0    # records overwritten before flush
+        self.encoded = {}
+
+    def record(self, layout, source):
+        """Adds event to the buffer, never touches the file"""
+        encoded = self.encoded.get(layout)
+        if encoded is None:
+            encoded = self.encoded[layout] = layout.encode('utf-8')[:LAYOUT_SIZE]
+        RECORD.pack_into(self.buffer, (self.count % self.capacity) * RECORD.size,
+                         time.time(), encoded, SOURCE_CODES[source])
+        self.count += 1
+
+    def flush(self):
+        """Appends buffered events to the history file"""
+        pending = self.count - self.flushed
+        if pending <= 0:
+            return
+        if pending > self.capacity:
+            self.dropped += pending - self.capacity
+            self.flushed = self.count - self.capacity
+            pending = self.capacity
+
+        start = (self.flushed % self.capacity) * RECORD.size
+        end = start + pending * RECORD.size
+        if end <= len(self.buffer):
+            data = self.buffer[start:end]
+        else:
+            data = self.buffer[start:] + self.buffer[:end - len(self.buffer)]
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.flushed = self.count
+        except OSError as e:
+            print("Error saving history: {}".format(e))
+
+def iter_records(path, chunk_records=4096):
+    """Yields (timestamp, layout, source) reading file chunk by chunk"""
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(RECORD.size * chunk_records)
+            if not data:
+                break
+            # Ignore truncated record left by an interrupted write
+            data = data[:len(data) - len(data) % RECORD.size]
+            for timestamp, layout, source in RECORD.iter_unpack(data):
+                if source < len(SOURCES):
+                    yield timestamp, layout.rstrip(b'\0').decode('utf-8', 'replace'), SOURCES[source]
+
+def aggregate(records):
+    """Returns dwell seconds and switch counts per layout, switches per hour of day"""
+    dwell = {}
+    switches = {}
+    hours = [0] * 24
+    prev_time = None
+    prev_layout = None
+
+    for timestamp, layout, source in records:
+        if prev_layout is not None and source != 'start':
+            dwell[prev_layout] = dwell.get(prev_layout, 0.0) + max(0.0, timestamp - prev_time)
+        if source == 'stop':
+            prev_layout = None
+            continue
+        if source != 'start':
+            switches[layout] = switches.get(layout, 0) + 1
+            hours[time.localtime(timestamp).tm_hour] += 1
+        dwell.setdefault(layout, 0.0)
+        prev_time = timestamp
+        prev_layout = layout
+
+    return dwell, switches, hours
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+def print_report(path):
+    """Prints usage summary of history file"""
+    try:
+        dwell, switches, hours = aggregate(iter_records(path))
+    except OSError as e:
+        print("Error reading history: {}".format(e))
+        return False
+
+    total = sum(dwell.values()) or 1.0
+    print("{:<10} {:>12} {:>7} {:>9}".format('Layout', 'Time', 'Share', 'Switches'))
+    for layout in sorted(dwell, key=dwell.get, reverse=True):
+        print("{:<10} {:>12} {:>6.1f}% {:>9}".format(
+            layout, format_duration(dwell[layout]), dwell[layout] * 100 / total,
+            switches.get(layout, 0)))
+
+    print("")
+    print("{:<10} {:>9}".format('Hour', 'Switches'))
+    for hour, count in enumerate(hours):
+        if count:
+            print("{:02d}:00      {:>9}".format(hour, count))
+    return True
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = Config().get_history_file()
+    if not print_report(path):
+        sys.exit(1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Layout change hooks for keyboard panel plugin
+"""
+
+import os
+import sys
+import shlex
+import signal
+import subprocess
+import threading
+from collections import deque
+
+# Executed by a child interpreter: python -c ENTRY_POINT_RUNNER spec old new
+ENTRY_POINT_RUNNER = (
+    "import sys, importlib\n"
+    "module_name, _, func_name = sys.argv[1].partition(':')\n"
+    "getattr(importlib.import_module(module_name), func_name)(sys.argv[2], sys.argv[3])\n"
+)
+
+class CommandHook:
+    """Runs an executable as: <command> <old_layout> <new_layout>"""
+
+    def __init__(self, command):
+        self.args = shlex.split(command)
+        self.name = command
+
+    def start(self, old_layout, new_layout):
+        """Starts hook in its own process group and returns the Popen"""
+        env = dict(os.environ)
+        env['KEYBOARD_PANEL_OLD_LAYOUT'] = old_layout
+        env['KEYBOARD_PANEL_NEW_LAYOUT'] = new_layout
+        # New session, so the whole group including grandchildren can be killed
+        return subprocess.Popen(self.args + [old_layout, new_layout], env=env,
+                                stdin=subprocess.DEVNULL, start_new_session=True)
+
+def kill_process_group(proc):
+    """Kills hook process and everything it started"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+class PythonHook(CommandHook):
+    """Calls a Python entry point 'module:function' as function(old, new)
+
+    The entry point runs in a child interpreter, so it can be killed on
+    timeout and never holds the GIL of the panel process.
+    """
+
+    def __init__(self, spec):
+        module_name, _, func_name = spec.partition(':')
+        if not module_name or not func_name:
+            raise ValueError("invalid entry point '{}'".format(spec))
+        self.args = [sys.executable, '-c', ENTRY_POINT_RUNNER, spec]
+        self.name = spec
+
+class HookRunner:
+    """Runs layout change hooks on a bounded pool of worker threads
+
+    fire() never blocks: events go to a fixed-size queue and the oldest
+    pending ones are dropped when hooks can't keep up.
+    """
+
+    def __init__(self, hooks, timeout=5.0, workers=2, queue_size=16):
+        self.hooks = hooks
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self.queue = deque(maxlen=max(1, queue_size))
+        self.cond = threading.Condition()
+        self.threads = []
+        self.processes = set()
+        self.dropped = 0
+        self.running = True
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates runner with hooks configured in [hooks] section"""
+        hooks = []
+        for command in config.get_hook_commands():
+            try:
+                hooks.append(CommandHook(command))
+            except ValueError as e:
+                print("Hook error: {}".format(e))
+        for spec in config.get_hook_entry_points():
+            try:
+                hooks.append(PythonHook(spec))
+            except ValueError as e:
+                print("Hook error: {}".format(e))
+        return cls(hooks,
+                   config.get_hook_timeout(),
+                   config.get_hook_workers(),
+                   config.get_hook_queue_size())
+
+    def fire(self, old_layout, new_layout):
+        """Queues all hooks for a layout change"""
+        if not self.hooks:
+            return
+        with self.cond:
+            if not self.running:
+                return
+            dropped = 0
+            for hook in self.hooks:
+                if len(self.queue) == self.queue.maxlen:
+                    dropped += 1
+                self.queue.append((hook, old_layout, new_layout))
+            if dropped:
+                self.dropped += dropped
+                print("Hook queue full, dropped {} oldest calls ({} total)".format(
+                    dropped, self.dropped))
+            # One worker per queued hook, up to the pool size
+            while len(self.threads) < min(self.workers, len(self.queue)):
+                self._start_worker()
+            self.cond.notify(len(self.hooks))
+
+    def shutdown(self):
+        """Stops workers and kills running hooks, pending events are discarded"""
+        with self.cond:
+            self.running = False
+            self.queue.clear()
+            for proc in self.processes:
+                kill_process_group(proc)
+            self.cond.notify_all()
+
+    def _start_worker(self):
+        worker = threading.Thread(target=self._worker)
+        worker.daemon = True
+        worker.start()
+        self.threads.append(worker)
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                hook, old_layout, new_layout = self.queue.popleft()
+            try:
+                proc = hook.start(old_layout, new_layout)
+            except OSError as e:
+                print("Hook error: {}: {}".format(hook.name, e))
+                continue
+            with self.cond:
+                if not self.running:
+                    kill_process_group(proc)
+                    proc.wait()
+                    return
+                self.processes.add(proc)
+            try:
+                proc.wait(self.timeout)
+            except subprocess.TimeoutExpired:
+                print("Hook timed out: {}".format(hook.name))
+                kill_process_group(proc)
+                proc.wait()
+            finally:
+                with self.cond:
+                    self.processes.discard(proc)
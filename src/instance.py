@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Single instance lock and command handoff for keyboard panel plugin
+
+The running panel holds an flock on a lock file and receives commands on a
+datagram Unix socket next to it. Further invocations send their command
+there and exit without loading GTK. Both files live in a directory only
+the current user can access ($XDG_RUNTIME_DIR, or a private directory in
+/tmp), so other users can neither send commands nor take the lock.
+"""
+
+import os
+import stat
+import fcntl
+import socket
+
+COMMANDS = ('next', 'prev', 'switch', 'quit')
+MAX_MESSAGE = 4096
+
+def get_runtime_dir(create=False):
+    """Returns private directory for lock and socket
+
+    Raises OSError if the fallback directory isn't owned by the current
+    user or is accessible by others.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+
+    # Not tempfile.gettempdir(): importing tempfile costs more than the handoff itself
+    tmp_dir = os.environ.get('TMPDIR') or '/tmp'
+    runtime_dir = os.path.join(tmp_dir, 'keyboard-panel-{}'.format(os.getuid()))
+    if create:
+        try:
+            os.mkdir(runtime_dir, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(runtime_dir)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & 0o077):
+        raise OSError("unsafe runtime directory {}".format(runtime_dir))
+    return runtime_dir
+
+def get_paths(create=False):
+    """Returns (lock file, socket) paths for current display"""
+    display = os.environ.get('WAYLAND_DISPLAY') or os.environ.get('DISPLAY', '')
+    base = os.path.join(get_runtime_dir(create),
+                        'keyboard-panel-{}'.format(display.replace('/', '_')))
+    return base + '.lock', base + '.sock'
+
+def parse_command(args):
+    """Validates command line and returns command as list of words
+
+    Accepted forms: (empty), next, prev, quit, switch <layout>,
+    switch to <layout>. Raises ValueError for anything else.
+    """
+    if not args:
+        return []
+    name = args[0]
+    if name not in COMMANDS:
+        raise ValueError("unknown command '{}'".format(name))
+    if name == 'switch':
+        rest = args[1:]
+        if rest and rest[0] == 'to':
+            rest = rest[1:]
+        if len(rest) != 1:
+            raise ValueError("usage: switch [to] <layout>")
+        return ['switch', rest[0]]
+    if len(args) > 1:
+        raise ValueError("command '{}' takes no arguments".format(name))
+    return [name]
+
+def send_command(command):
+    """Sends command to running panel, returns False if none is running"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        _, socket_path = get_paths()
+        sock.sendto('\n'.join(command).encode('utf-8'), socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+def forward_command(args):
+    """Hands command line over to running panel if there is one"""
+    try:
+        command = parse_command(args)
+    except ValueError:
+        # Let main() report the error
+        return False
+    return send_command(command)
+
+class InstanceLock:
+    """Lock and command socket held by the running panel
+
+    Raises OSError on creation if another panel already holds the lock.
+    The lock is released by the kernel when the process exits, so a
+    crashed panel never blocks the next start.
+    """
+
+    def __init__(self):
+        lock_path, self.socket_path = get_paths(create=True)
+        self.lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Socket left by a crashed panel, safe to replace under the lock
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.socket_path)
+            self.sock.setblocking(False)
+        except OSError:
+            self.lock_file.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        """Reads one pending command without blocking, None if there is none"""
+        try:
+            data = self.sock.recv(MAX_MESSAGE)
+        except OSError:
+            return None
+        try:
+            return parse_command(data.decode('utf-8').split('\n') if data else [])
+        except (UnicodeDecodeError, ValueError) as e:
+            print("Instance command error: {}".format(e))
+            return None
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        self.lock_file.close()
@@ -4,11 +4,19 @@
 Показывает текущую раскладку клавиатуры и позволяет переключать языки
 """
 
-import gi
 import os
 import sys
+import instance
+
+if __name__ == '__main__' and instance.forward_command(sys.argv[1:]):
+    # Panel is already running and took the command, skip GTK startup
+    sys.exit(0)
+
+import gi
 import subprocess
 import signal
+import threading
+import time
 
 gi.require_version('Gtk', '3.0')
 
@@ -31,17 +39,121 @@ if not WAYLAND_MODE:
 else:
     USE_APPINDICATOR = False
 
-from gi.repository import Gtk, GObject, GLib
+from gi.repository import Gtk, Gdk, GObject, GLib
 from config import Config
 from flags import get_flag_emoji, get_flag_text, get_country_name
+from hooks import HookRunner
+from history import UsageHistory, print_report
+
+# Lock/latch indicators: (config option, menu label, panel text)
+LOCK_INDICATORS = [
+    ('caps_lock', 'Caps Lock', 'CAPS'),
+    ('num_lock', 'Num Lock', 'NUM'),
+    ('scroll_lock', 'Scroll Lock', 'SCRL'),
+    ('level3', 'Level3 latch', 'L3')
+]
+
+class LayoutSwitcher:
+    """Coalesces layout switch requests and applies them off the main loop
+
+    Only the latest requested layout is applied; requests arriving while a
+    switch is running or inside the rate limit window replace the pending
+    target instead of queueing another setxkbmap call.
+    """
+
+    def __init__(self, apply_func, query_func, on_confirmed, min_interval=0.15):
+        self.apply_func = apply_func
+        self.query_func = query_func
+        self.on_confirmed = on_confirmed
+        self.min_interval = min_interval
+        self.target = None
+        self.busy = False
+        self.timer_id = None
+        self.last_apply = 0.0
+
+    def request(self, layout):
+        """Queues layout as the new switch target"""
+        self.target = layout
+        self._schedule()
+
+    def is_pending(self):
+        """Returns True while a switch is queued or running"""
+        return self.busy or self.target is not None
+
+    def _schedule(self):
+        if self.busy or self.timer_id is not None or self.target is None:
+            return
+        delay = self.last_apply + self.min_interval - time.monotonic()
+        if delay > 0:
+            self.timer_id = GLib.timeout_add(int(delay * 1000) + 1, self._on_timer)
+        else:
+            self._start()
+
+    def _on_timer(self):
+        self.timer_id = None
+        self._start()
+        return False
+
+    def _start(self):
+        layout = self.target
+        self.target = None
+        self.busy = True
+        self.last_apply = time.monotonic()
+        worker = threading.Thread(target=self._worker, args=(layout,))
+        worker.daemon = True
+        worker.start()
+
+    def _worker(self, layout):
+        ok = self.apply_func(layout)
+        actual = self.query_func()
+        GLib.idle_add(self._on_done, layout, ok, actual)
+
+    def _on_done(self, layout, ok, actual):
+        self.busy = False
+        if self.target == actual:
+            # Requests meanwhile ended on the layout that is already active
+            self.target = None
+        if self.target is not None:
+            # Newer request arrived meanwhile, result is already stale
+            self._schedule()
+        else:
+            self.on_confirmed(layout, ok, actual)
+        return False
 
 class KeyboardPanel:
     def __init__(self):
         self.current_layout = "en"
+        self.confirmed_layout = None
+        self.switch_source = 'click'
         self.layouts = self.get_available_layouts()
         self.config = Config()
         self.indicator = None
+        self.indicator_menu = None
+        self.popup_menu = None
+        self.instance_lock = None
         self.status_icon = None
+        self.switcher = LayoutSwitcher(
+            self.set_layout,
+            self.get_current_layout,
+            self.on_layout_confirmed,
+            self.config.get_switch_interval()
+        )
+        self.hooks = HookRunner.from_config(self.config)
+        self.history = None
+        if self.config.get_history_enabled():
+            self.history = UsageHistory(self.config.get_history_file(),
+                                        self.config.get_history_capacity())
+            GLib.timeout_add_seconds(self.config.get_history_flush_interval(),
+                                     self.flush_history)
+        
+        # Lock key state comes from XKB state notifications via GDK keymap.
+        # On Wayland GDK only sees it while the panel has keyboard focus,
+        # so lock indicators are X11 only.
+        self.lock_state = {}
+        if not WAYLAND_MODE:
+            self.keymap = Gdk.Keymap.get_for_display(Gdk.Display.get_default())
+            self.lock_state = self.get_lock_state()
+            self.keymap.connect('state-changed', self.on_keymap_state_changed)
         
         if USE_APPINDICATOR:
             # Create AppIndicator for X11
@@ -51,7 +163,7 @@ class KeyboardPanel:
                 AppIndicator3.IndicatorCategory.SYSTEM_SERVICES
             )
             self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
-            self.indicator.set_menu(self.create_menu())
+            self.refresh_menu()
         else:
             # Create a simple window for Wayland/fallback
             self.create_panel_window()
@@ -228,40 +340,123 @@ class KeyboardPanel:
 
     def on_layout_selected(self, widget, layout):
         """Layout selection handler"""
-        if self.set_layout(layout):
-            self.current_layout = layout
+        self.request_layout(layout)
+
+    def request_layout(self, layout, source='click'):
+        """Shows layout immediately and queues the actual switch"""
+        if layout == self.current_layout and not self.switcher.is_pending():
+            return
+        self.switch_source = source
+        self.current_layout = layout
+        self.update_indicator_display()
+        self.switcher.request(layout)
+
+    def on_layout_confirmed(self, layout, ok, actual):
+        """Reconciles optimistic display with the layout reported by setxkbmap"""
+        self.layout_changed(actual, self.switch_source)
+        if actual != self.current_layout:
+            self.current_layout = actual
             self.update_indicator_display()
-            # Update menu
-            if USE_APPINDICATOR and self.indicator:
-                self.indicator.set_menu(self.create_menu())
+        # Update menu
+        self.refresh_menu()
 
     def update_current_layout(self):
         """Updates current layout information"""
+        if self.switcher.is_pending():
+            # Don't overwrite optimistic display until the switch completes
+            return True
         new_layout = self.get_current_layout()
+        self.layout_changed(new_layout, 'external')
         if new_layout != self.current_layout:
             self.current_layout = new_layout
             self.update_indicator_display()
             # Update menu when layout changes
-            if USE_APPINDICATOR and self.indicator:
-                self.indicator.set_menu(self.create_menu())
+            self.refresh_menu()
         return True  # Continue timer
 
+    def layout_changed(self, layout, source):
+        """Records history and fires hooks when the confirmed system layout changes"""
+        old_layout = self.confirmed_layout
+        self.confirmed_layout = layout
+        if old_layout is None:
+            if self.history:
+                self.history.record(layout, 'start')
+        elif old_layout != layout:
+            if self.history:
+                self.history.record(layout, source)
+            self.hooks.fire(old_layout, layout)
+
+    def flush_history(self):
+        """Writes buffered history events to file"""
+        self.history.flush()
+        return True  # Continue timer
+
+    def get_lock_state(self):
+        """Returns current lock/latch state from the keymap"""
+        state = {
+            'caps_lock': self.keymap.get_caps_lock_state(),
+            'num_lock': self.keymap.get_num_lock_state(),
+            # Level3 shift is bound to Mod5 by the standard XKB rules
+            'level3': bool(self.keymap.get_modifier_state() & Gdk.ModifierType.MOD5_MASK)
+        }
+        try:
+            state['scroll_lock'] = self.keymap.get_scroll_lock_state()
+        except AttributeError:
+            # GTK < 3.18
+            state['scroll_lock'] = False
+        return state
+
+    def on_keymap_state_changed(self, keymap):
+        """XKB state change handler"""
+        state = self.get_lock_state()
+        if state != self.lock_state:
+            self.lock_state = state
+            self.update_indicator_display()
+
+    def get_lock_text(self):
+        """Returns text for enabled indicators whose lock is active"""
+        active = []
+        for option, label, text in LOCK_INDICATORS:
+            if self.lock_state.get(option) and self.config.get_indicator(option):
+                active.append(text)
+        return ' '.join(active)
+
     def on_button_press(self, widget, event):
         """Handle button press on panel window"""
         if event.button == 1:  # Left click
             self.on_status_icon_activate(None)
         elif event.button == 3:  # Right click
-            menu = self.create_menu()
-            menu.popup(None, None, None, None, event.button, event.time)
+            self.show_popup_menu(event.button, event.time)
         return True
 
     def on_popup_menu(self, icon, button, time):
         """Handle right-click on StatusIcon"""
-        menu = self.create_menu()
-        menu.popup(None, None, None, None, button, time)
+        self.show_popup_menu(button, time)
+
+    def show_popup_menu(self, button, time):
+        """Pops up a fresh context menu, destroying the previous one"""
+        if self.popup_menu is not None:
+            self.popup_menu.destroy()
+        self.popup_menu = self.create_menu()
+        self.popup_menu.popup(None, None, None, None, button, time)
+
+    def refresh_menu(self):
+        """Replaces AppIndicator menu, destroying the old one"""
+        if not (USE_APPINDICATOR and self.indicator):
+            return
+        old_menu = self.indicator_menu
+        self.indicator_menu = self.create_menu()
+        self.indicator.set_menu(self.indicator_menu)
+        if old_menu is not None:
+            # May be called from a handler of the old menu's item
+            GLib.idle_add(old_menu.destroy)
     
     def on_status_icon_activate(self, icon):
         """Handle left-click on StatusIcon"""
+        self.cycle_layout(1)
+
+    def cycle_layout(self, step, source='click'):
+        """Switches to next (step=1) or previous (step=-1) layout"""
         # Toggle between layouts if multiple available
         if len(self.layouts) > 1:
             current_idx = 0
@@ -269,11 +464,33 @@ class KeyboardPanel:
                 current_idx = self.layouts.index(self.current_layout)
             except ValueError:
                 pass
-            next_idx = (current_idx + 1) % len(self.layouts)
-            next_layout = self.layouts[next_idx]
-            if self.set_layout(next_layout):
-                self.current_layout = next_layout
-                self.update_indicator_display()
+            next_idx = (current_idx + step) % len(self.layouts)
+            self.request_layout(self.layouts[next_idx], source)
+
+    def attach_instance_lock(self, lock):
+        """Starts accepting commands from other invocations"""
+        self.instance_lock = lock
+        GLib.io_add_watch(lock.fileno(), GLib.PRIORITY_DEFAULT,
+                          GLib.IOCondition.IN, self.on_instance_command)
+
+    def on_instance_command(self, source, condition):
+        """Handles command forwarded by another invocation"""
+        command = self.instance_lock.receive()
+        if command:
+            self.run_command(command)
+        return True
+
+    def run_command(self, command):
+        """Executes command parsed by instance.parse_command"""
+        # Commands come from scripts and hotkey bindings
+        if command[0] == 'next':
+            self.cycle_layout(1, 'hotkey')
+        elif command[0] == 'prev':
+            self.cycle_layout(-1, 'hotkey')
+        elif command[0] == 'switch':
+            self.request_layout(command[1], 'hotkey')
+        elif command[0] == 'quit':
+            self.quit()
 
     def create_settings_menu(self):
         """Creates settings menu"""
@@ -306,6 +523,20 @@ class KeyboardPanel:
         text_item.connect('activate', self.on_show_text_changed)
         menu.append(text_item)
         
+        # Lock indicators (X11 only)
+        if not WAYLAND_MODE:
+            indicators_item = Gtk.MenuItem(label="Lock indicators")
+            indicators_submenu = Gtk.Menu()
+            
+            for option, label, text in LOCK_INDICATORS:
+                item = Gtk.CheckMenuItem(label=label)
+                item.set_active(self.config.get_indicator(option))
+                item.connect('activate', self.on_indicator_changed, option)
+                indicators_submenu.append(item)
+            
+            indicators_item.set_submenu(indicators_submenu)
+            menu.append(indicators_item)
+        
         menu.show_all()
         return menu
     
@@ -315,14 +546,18 @@ class KeyboardPanel:
             self.config.set_icon_type(icon_type)
             self.update_indicator_display()
             # Update menu to show only one active option
-            if USE_APPINDICATOR and self.indicator:
-                self.indicator.set_menu(self.create_menu())
+            self.refresh_menu()
     
     def on_show_text_changed(self, widget):
         """Text display change handler"""
         self.config.set_show_text(widget.get_active())
         self.update_indicator_display()
     
+    def on_indicator_changed(self, widget, option):
+        """Lock indicator toggle handler"""
+        self.config.set_indicator(option, widget.get_active())
+        self.update_indicator_display()
+    
     def update_indicator_display(self):
         """Updates indicator display (icon and text)"""
         icon_type = self.config.get_icon_type()
@@ -344,6 +579,10 @@ class KeyboardPanel:
         else:
             label_text = self.current_layout.upper()
         
+        lock_text = self.get_lock_text()
+        if lock_text:
+            label_text = "{} {}".format(label_text, lock_text)
+        
         if USE_APPINDICATOR and self.indicator:
             # AppIndicator mode (X11)
             if icon_type == 'flag':
@@ -389,9 +628,23 @@ class KeyboardPanel:
                         self.text_label.show()
                     else:
                         self.text_label.hide()
+                
+                # Append lock indicators
+                if lock_text:
+                    if self.text_label.get_visible():
+                        self.text_label.set_text("{} {}".format(self.text_label.get_text(), lock_text))
+                    else:
+                        self.text_label.set_text(lock_text)
+                        self.text_label.show()
 
     def quit(self, widget=None):
         """Terminates application"""
+        self.hooks.shutdown()
+        if self.instance_lock:
+            self.instance_lock.close()
+        if self.history:
+            self.history.record(self.confirmed_layout or self.current_layout, 'stop')
+            self.history.flush()
         Gtk.main_quit()
 
     def run(self):
@@ -409,10 +662,31 @@ def main():
     """Application entry point"""
     if len(sys.argv) > 1 and sys.argv[1] == '--help':
         print("Keyboard panel plugin for Raspberry Pi OS taskbar")
-        print("Usage: keyboard_panel.py")
+        print("Usage: keyboard_panel.py [next | prev | switch [to] <layout> | quit]")
         print("")
         print("Shows current keyboard layout in system tray")
         print("and allows switching languages via context menu.")
+        print("If the panel is already running, the command is passed to it.")
+        print("")
+        print("       keyboard_panel.py --history [file]")
+        print("Prints layout usage statistics.")
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--history':
+        config = Config()
+        path = sys.argv[2] if len(sys.argv) > 2 else config.get_history_file()
+        if not print_report(path):
+            sys.exit(1)
+        return
+
+    try:
+        command = instance.parse_command(sys.argv[1:])
+    except ValueError as e:
+        print("Error: {}".format(e))
+        sys.exit(1)
+
+    if command == ['quit']:
+        # Nothing to stop, running panel would have taken the command
         return
 
     # Check if graphics environment is running
@@ -420,8 +694,23 @@ def main():
         print("Error: No graphics environment found (DISPLAY not set)")
         sys.exit(1)
 
+    try:
+        lock = instance.InstanceLock()
+    except BlockingIOError:
+        # Another panel grabbed the lock after our first check
+        if instance.send_command(command):
+            return
+        print("Error: Keyboard panel is already running")
+        sys.exit(1)
+    except OSError as e:
+        print("Error: Can't create instance lock: {}".format(e))
+        sys.exit(1)
+
     try:
         panel = KeyboardPanel()
+        panel.attach_instance_lock(lock)
+        if command:
+            panel.run_command(command)
         panel.run()
     except Exception as e:
         print("Startup error: {}".format(e))